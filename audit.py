@@ -0,0 +1,175 @@
+# Запись Log строк: синхронно (в транзакции запроса) или через фоновую очередь
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from models import db, Log
+
+logger = logging.getLogger(__name__)
+
+
+class SyncAuditSink:
+    # Log попадает в сессию запроса и коммитится вместе с ним (строгий режим)
+    def record(self, author_id, target_id, target_type, action_type):
+        log = Log(author_id=author_id, target_id=target_id, target_type=target_type, action_type=action_type)
+        db.session.add(log)
+        return log
+
+    def flush(self, timeout=None):
+        return True
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"mode": "sync"}
+
+
+class QueuedAuditSink:
+    def __init__(self, app, maxsize=10000, batch_size=500, flush_interval=1.0, enqueue_timeout=0.05):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.enqueued = 0
+        self.written = 0
+        self.delayed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, author_id, target_id, target_type, action_type):
+        row = {
+            "author_id": author_id,
+            "target_id": target_id,
+            "target_type": target_type,
+            "action_type": action_type,
+            "action_time": datetime.utcnow(),
+        }
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            # backpressure: ждём немного, затем отбрасываем
+            with self._lock:
+                self.delayed += 1
+            try:
+                self.queue.put(row, timeout=self.enqueue_timeout)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+                logger.warning("Audit queue full, dropped %s/%s entry", target_type, action_type)
+                return None
+        with self._lock:
+            self.enqueued += 1
+        return row
+
+    def _run(self):
+        while not self._stop.is_set() or not self.queue.empty():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _collect(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if self._stop.is_set():
+                # остановка: дописываем то, что уже в очереди, полными пачками
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                try:
+                    db.session.execute(insert(Log), batch)
+                    db.session.commit()
+                    written = len(batch)
+                except Exception:
+                    # одна плохая строка не должна терять всю пачку: пишем по одной
+                    db.session.rollback()
+                    logger.warning("Audit batch of %s entries failed, retrying row by row", len(batch), exc_info=True)
+                    written = self._write_rows(batch)
+            with self._lock:
+                self.written += written
+                self.failed += len(batch) - written
+                self.batches += 1
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write_rows(self, batch):
+        written = 0
+        for row in batch:
+            try:
+                db.session.execute(insert(Log), [row])
+                db.session.commit()
+                written += 1
+            except Exception:
+                db.session.rollback()
+                logger.exception("Audit entry %s/%s failed", row["target_type"], row["action_type"])
+        return written
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=10):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": "queued",
+                "queue_depth": self.queue.qsize(),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "delayed": self.delayed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+            }
+
+
+def init_audit(app):
+    # AUDIT_MODE: "sync" (по умолчанию) или "queued"
+    if app.config.get("AUDIT_MODE", "sync") == "queued":
+        sink = QueuedAuditSink(
+            app,
+            maxsize=app.config.get("AUDIT_QUEUE_SIZE", 10000),
+            batch_size=app.config.get("AUDIT_BATCH_SIZE", 500),
+            flush_interval=app.config.get("AUDIT_FLUSH_INTERVAL", 1.0),
+            enqueue_timeout=app.config.get("AUDIT_ENQUEUE_TIMEOUT", 0.05),
+        )
+        atexit.register(sink.close)
+    else:
+        sink = SyncAuditSink()
+    app.extensions["audit"] = sink
+    return sink
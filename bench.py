@@ -0,0 +1,344 @@
+# Нагрузочный бенчмарк: заполнение БД (SQLite или PostgreSQL) и прогон типовых сценариев
+# через Flask test client или локальный WSGI-сервер с параллельными клиентами
+
+import http.cookiejar
+import json
+import math
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from models import db, User, Torrent, Comment, ForumPost, Activity, Log
+
+DEFAULT_VOLUMES = {"users": 1000, "torrents": 10000, "comments": 50000, "posts": 2000, "activities": 20000, "logs": 100000}
+# сценарий -> вес в смеси запросов
+FLOW_WEIGHTS = {"browse": 40, "view_torrent": 35, "comment": 10, "toggle_seed": 10, "logs": 5}
+BENCH_PASSWORD = "bench"
+
+
+def _insert_batches(model, rows, batch_size=5000):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+
+
+def _user_name(i):
+    return f'bench_user_{i}'
+
+
+def seed(volumes, password_hash, rng_seed=42):
+    # Детерминированно при одном rng_seed; каждый десятый пользователь — модератор (для /logs)
+    rng = random.Random(rng_seed)
+    now = datetime.utcnow()
+
+    def past(days=30):
+        return now - timedelta(seconds=rng.randrange(days * 86400))
+
+    _insert_batches(User, (
+        {
+            "username": _user_name(i),
+            "mail": f'bench{i}@example.com',
+            "user_password": password_hash,
+            "user_role": "tmoderator" if i % 10 == 0 else "tuser",
+            "rating": rng.randrange(100),
+        }
+        for i in range(volumes["users"])
+    ))
+    user_ids = db.session.scalars(select(User.user_id).where(User.username.like("bench_user_%")).order_by(User.user_id)).all()
+    _insert_batches(Torrent, (
+        {
+            "hash_str": f'{rng_seed:04x}{i:036x}',
+            "title": f'Bench torrent {i}',
+            "description": f'Seeded torrent number {i}',
+            "author_id": rng.choice(user_ids),
+            "updated_at": past(),
+        }
+        for i in range(volumes["torrents"])
+    ))
+    torrent_ids = db.session.scalars(select(Torrent.torrent_id).where(Torrent.title.like("Bench torrent %"))).all()
+    _insert_batches(Comment, (
+        {"user_id": rng.choice(user_ids), "torrent_id": rng.choice(torrent_ids), "comment_body": f'Bench comment {i}', "updated_at": past()}
+        for i in range(volumes["comments"])
+    ))
+    _insert_batches(ForumPost, (
+        {"author_id": rng.choice(user_ids), "post_title": f'Bench post {i}', "post_body": f'Seeded forum post {i}', "updated_at": past()}
+        for i in range(volumes["posts"])
+    ))
+    # одна строка activity на пару (user, torrent)
+    pairs = set()
+    limit = min(volumes["activities"], len(user_ids) * len(torrent_ids))
+    while len(pairs) < limit:
+        pairs.add((rng.choice(user_ids), rng.choice(torrent_ids)))
+    _insert_batches(Activity, (
+        {"user_id": user_id, "torrent_id": torrent_id, "action_type": rng.choice(("peer", "seed"))}
+        for user_id, torrent_id in sorted(pairs)
+    ))
+    _insert_batches(Log, (
+        {
+            "author_id": rng.choice(user_ids),
+            "target_id": rng.choice(torrent_ids),
+            "target_type": rng.choice(("torrent", "comment", "user", "activity")),
+            "action_type": rng.choice(("upload", "login", "add rating", "logout")),
+            "action_time": past(),
+        }
+        for _ in range(volumes["logs"])
+    ))
+    db.session.commit()
+    return {"users": len(user_ids), "torrents": len(torrent_ids), **{k: volumes[k] for k in ("comments", "posts", "logs")}, "activities": len(pairs)}
+
+
+class TestClientTransport:
+    # в процессе, без сети: измеряется только приложение
+    def __init__(self, app):
+        self.app = app
+
+    def client(self):
+        return _FlaskClient(self.app.test_client())
+
+    def close(self):
+        pass
+
+
+class _FlaskClient:
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, int(response.headers.get("X-Query-Count", 0)), size
+
+
+class HttpTransport:
+    # локальный многопоточный WSGI-сервер werkzeug; клиенты ходят через HTTP
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def client(self):
+        return _HttpClient(self.base_url)
+
+    def close(self):
+        self.server.shutdown()
+        self.thread.join()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # как и test client: редирект — это ответ, а не ещё один запрос
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class _HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, int(response.headers.get("X-Query-Count", 0)), len(response.read())
+        except urllib.error.HTTPError as e:
+            size = len(e.read())
+            return e.code, int(e.headers.get("X-Query-Count", 0)), size
+
+
+class VirtualUser:
+    def __init__(self, client, index, user_count, torrent_titles, torrent_ids, rng):
+        self.client = client
+        self.user_index = index % user_count
+        self.moderator = self.user_index % 10 == 0
+        self.torrent_titles = torrent_titles
+        self.torrent_ids = torrent_ids
+        self.rng = rng
+
+    def login(self):
+        return self.client.request("POST", "/login", {"mail": f'bench{self.user_index}@example.com', "password": BENCH_PASSWORD})
+
+    def pick_flow(self):
+        flows = [f for f in FLOW_WEIGHTS if f != "logs" or self.moderator]
+        return self.rng.choices(flows, weights=[FLOW_WEIGHTS[f] for f in flows])[0]
+
+    def run(self, flow):
+        if flow == "browse":
+            if self.rng.random() < 0.5:
+                return self.client.request("GET", "/torrents")
+            return self.client.request("GET", "/torrents?sort=swarm")
+        if flow == "view_torrent":
+            return self.client.request("GET", f'/torrent/{self.rng.choice(self.torrent_ids)}')
+        if flow == "comment":
+            title = self.rng.choice(self.torrent_titles)
+            return self.client.request("POST", "/comment_upload", {"title": title, "comment_body": "Benchmark comment"})
+        if flow == "toggle_seed":
+            return self.client.request("POST", f'/torrents/{self.rng.choice(self.torrent_ids)}/change_status')
+        return self.client.request("GET", "/logs")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, wall_seconds):
+    def stats(rows):
+        latencies = sorted(row[1] for row in rows)
+        return {
+            "requests": len(rows),
+            "errors": sum(1 for row in rows if row[2] >= 400),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2) if rows else None,
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2) if rows else None,
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2) if rows else None,
+            "queries_per_request": round(sum(row[3] for row in rows) / len(rows), 2) if rows else None,
+            "bytes_per_request": round(sum(row[4] for row in rows) / len(rows)) if rows else None,
+        }
+
+    report = stats(samples)
+    report["throughput_rps"] = round(len(samples) / wall_seconds, 1) if wall_seconds else 0.0
+    report["seconds"] = round(wall_seconds, 3)
+    report["flows"] = {flow: stats([row for row in samples if row[0] == flow]) for flow in sorted({row[0] for row in samples})}
+    return report
+
+
+def run_benchmark(app, mode="client", clients=8, requests_per_client=100, rng_seed=42):
+    # X-Query-Count считается до начала потокового тела, для /logs это нижняя оценка
+    app.config["QUERY_COUNT_HEADER"] = True
+    with app.app_context():
+        torrents = db.session.execute(select(Torrent.torrent_id, Torrent.title).where(Torrent.title.like("Bench torrent %"))).all()
+        user_count = db.session.query(User.user_id).filter(User.username.like("bench_user_%")).count()
+        database = db.engine.dialect.name
+    if not torrents or not user_count:
+        raise RuntimeError("Database is not seeded, run \"flask bench-seed\" first")
+    torrent_ids = [t.torrent_id for t in torrents]
+    torrent_titles = [t.title for t in torrents]
+    transport = HttpTransport(app) if mode == "server" else TestClientTransport(app)
+    samples = []
+    lock = threading.Lock()
+    failed_logins = []
+
+    def worker(index):
+        user = VirtualUser(transport.client(), index, user_count, torrent_titles, torrent_ids, random.Random(rng_seed + index))
+        rows = []
+        started = time.perf_counter()
+        status, queries, size = user.login()
+        rows.append(("login", time.perf_counter() - started, status, queries, size))
+        if status != 302:
+            failed_logins.append(index)
+        for _ in range(requests_per_client):
+            flow = user.pick_flow()
+            started = time.perf_counter()
+            status, queries, size = user.run(flow)
+            rows.append((flow, time.perf_counter() - started, status, queries, size))
+        with lock:
+            samples.extend(rows)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        transport.close()
+    report = summarize(samples, time.perf_counter() - started)
+    report["failed_logins"] = len(failed_logins)
+    report["config"] = {
+        "mode": mode,
+        "clients": clients,
+        "requests_per_client": requests_per_client,
+        "seed": rng_seed,
+        "database": database,
+        "started_at": datetime.utcnow().isoformat(),
+    }
+    return report
+
+
+def upload_stress(app, mode="client", clients=8, uploads_per_client=25):
+    # Параллельные загрузки торрентов и комментариев: у каждой записи Log "upload"
+    # target_id должен совпасть с id вставленной строки (а не с угаданным max(id) + 1)
+    with app.app_context():
+        user_count = db.session.query(User.user_id).filter(User.username.like("bench_user_%")).count()
+        # bench-seed пишет случайные "upload" с настоящими id: проверяются только записи этого прогона
+        app.extensions["audit"].flush(timeout=30)
+        last_log_id = db.session.query(func.max(Log.log_id)).scalar() or 0
+    if not user_count:
+        raise RuntimeError("Database is not seeded, run \"flask bench-seed\" first")
+    run = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    prefix = f'Stress {run}'
+    transport = HttpTransport(app) if mode == "server" else TestClientTransport(app)
+    errors = []
+
+    def worker(index):
+        client = transport.client()
+        user = VirtualUser(client, index, user_count, [], [], random.Random(index))
+        if user.login()[0] != 302:
+            errors.append(f'client {index}: login failed')
+            return
+        for i in range(uploads_per_client):
+            title = f'{prefix} {index}-{i}'
+            status, _, _ = client.request("POST", "/torrent_upload", {"title": title, "hash_string": f'{run}-{index}-{i}', "description": "stress"})
+            if status != 302:
+                errors.append(f'{title}: upload returned {status}')
+                continue
+            status, _, _ = client.request("POST", "/comment_upload", {"title": title, "comment_body": f'{prefix} comment {index}-{i}'})
+            if status != 302:
+                errors.append(f'{title}: comment returned {status}')
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        transport.close()
+    with app.app_context():
+        app.extensions["audit"].flush(timeout=30)
+        torrents = dict(db.session.execute(select(Torrent.torrent_id, Torrent.author_id).where(Torrent.title.like(f'{prefix} %'))).all())
+        comments = dict(db.session.execute(
+            select(Comment.comment_id, Comment.user_id).where(Comment.comment_body.like(f'{prefix} comment %'))
+        ).all())
+        mismatches = []
+        for target_type, rows in (("torrent", torrents), ("comment", comments)):
+            logged = db.session.execute(
+                select(Log.target_id, Log.author_id)
+                .where(Log.log_id > last_log_id, Log.target_type == target_type, Log.action_type == "upload")
+                .where(Log.target_id.in_(list(rows) or [0]))
+            ).all()
+            found = {}
+            for target_id, author_id in logged:
+                found.setdefault(target_id, []).append(author_id)
+            for row_id, author_id in rows.items():
+                if found.get(row_id) != [author_id]:
+                    mismatches.append(f'{target_type} {row_id} by {author_id}: log entries {found.get(row_id)}')
+    return {"torrents": len(torrents), "comments": len(comments), "errors": errors, "mismatches": mismatches}
+
+
+def save_results(report, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
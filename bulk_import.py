@@ -0,0 +1,175 @@
+# Массовый импорт торрентов: CSV/NDJSON -> staging (COPY на PostgreSQL) -> один INSERT ... SELECT
+
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import db
+
+IMPORT_COLUMNS = ("hash_str", "title", "description", "author")
+# ограничения колонок torrents и users.username
+MAX_LENGTHS = {"hash_str": 255, "title": 200, "description": 255, "author": 100}
+
+
+class ImportProgress:
+    def __init__(self, callback=None, every=10000):
+        self.callback = callback
+        self.every = every
+        self.rows_read = 0
+        self.invalid = 0
+        self.started = time.monotonic()
+
+    def row(self, valid):
+        self.rows_read += 1
+        if not valid:
+            self.invalid += 1
+        if self.callback and self.rows_read % self.every == 0:
+            self.callback(self.report())
+
+    def report(self, inserted=None):
+        elapsed = time.monotonic() - self.started
+        report = {
+            "rows_read": self.rows_read,
+            "invalid": self.invalid,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(self.rows_read / elapsed, 1) if elapsed else 0.0,
+        }
+        if inserted is not None:
+            report["inserted"] = inserted
+            report["duplicates"] = self.rows_read - self.invalid - inserted
+        return report
+
+
+def iter_records(stream, fmt):
+    # stream — бинарный поток (файл или request.stream)
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    if fmt == "csv":
+        try:
+            yield from csv.DictReader(text_stream)
+        except csv.Error as e:
+            raise ValueError(f'Malformed CSV: {e}') from e
+    elif fmt == "ndjson":
+        for line in text_stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f'Unsupported import format: {fmt}')
+
+
+def valid_rows(records, progress):
+    for record in records:
+        # NDJSON-строка может быть валидным JSON, но не объектом ([1, 2], "x"), или со значениями не-строками
+        values = [record.get(column) for column in IMPORT_COLUMNS] if isinstance(record, dict) else None
+        if values is None or not all(value is None or isinstance(value, str) for value in values):
+            progress.row(False)
+            continue
+        row = tuple((value or "").strip() for value in values)
+        valid = all(row[:3]) and all(len(value) <= MAX_LENGTHS[column] for column, value in zip(IMPORT_COLUMNS, row))
+        progress.row(valid)
+        if valid:
+            yield row
+
+
+class CsvRowStream:
+    # file-like поверх генератора строк: COPY читает его кусками, весь файл в память не попадает
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                break
+            out = io.StringIO()
+            csv.writer(out).writerow(row)
+            self.buffer += out.getvalue()
+        if size < 0:
+            data, self.buffer = self.buffer, ""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _copy_to_staging_pg(rows):
+    connection = db.session.connection()
+    connection.execute(text(
+        "CREATE TEMP TABLE torrent_import_staging (hash_str text, title text, description text, author text) ON COMMIT DROP"
+    ))
+    cursor = connection.connection.dbapi_connection.cursor()
+    sql = "COPY torrent_import_staging (hash_str, title, description, author) FROM STDIN WITH (FORMAT csv)"
+    if hasattr(cursor, "copy_expert"):
+        # psycopg2
+        cursor.copy_expert(sql, CsvRowStream(rows))
+    else:
+        # psycopg 3
+        with cursor.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+    cursor.close()
+
+
+def _merge_pg(default_author_id):
+    # дубликаты по hash_str/title отбрасывает ON CONFLICT DO NOTHING на уникальных индексах
+    return db.session.execute(text("""
+        WITH ins AS (
+            INSERT INTO torrents (hash_str, title, description, author_id, updated_at)
+            SELECT s.hash_str, s.title, s.description, COALESCE(u.user_id, :author_id), now() AT TIME ZONE 'utc'
+            FROM torrent_import_staging s LEFT JOIN users u ON u.username = s.author
+            ON CONFLICT DO NOTHING
+            RETURNING torrent_id
+        ), stats AS (
+            INSERT INTO torrent_stats (torrent_id, seeders, leechers, comment_count)
+            SELECT torrent_id, 0, 0, 0 FROM ins
+        )
+        SELECT count(*) FROM ins
+    """), {"author_id": default_author_id}).scalar()
+
+
+def _copy_to_staging_sqlite(rows, batch_size=5000):
+    db.session.execute(text("DROP TABLE IF EXISTS temp.torrent_import_staging"))
+    db.session.execute(text(
+        "CREATE TEMP TABLE torrent_import_staging (hash_str text, title text, description text, author text)"
+    ))
+    insert = text("INSERT INTO torrent_import_staging VALUES (:hash_str, :title, :description, :author)")
+    batch = []
+    for row in rows:
+        batch.append(dict(zip(IMPORT_COLUMNS, row)))
+        if len(batch) >= batch_size:
+            db.session.execute(insert, batch)
+            batch = []
+    if batch:
+        db.session.execute(insert, batch)
+
+
+def _merge_sqlite(default_author_id):
+    max_before = db.session.execute(text("SELECT COALESCE(MAX(torrent_id), 0) FROM torrents")).scalar()
+    inserted = db.session.execute(text("""
+        INSERT OR IGNORE INTO torrents (hash_str, title, description, author_id, updated_at)
+        SELECT s.hash_str, s.title, s.description, COALESCE(u.user_id, :author_id), :now
+        FROM torrent_import_staging s LEFT JOIN users u ON u.username = s.author
+    """), {"author_id": default_author_id, "now": datetime.utcnow()}).rowcount
+    db.session.execute(text("""
+        INSERT INTO torrent_stats (torrent_id, seeders, leechers, comment_count)
+        SELECT torrent_id, 0, 0, 0 FROM torrents WHERE torrent_id > :max_before
+    """), {"max_before": max_before})
+    db.session.execute(text("DROP TABLE temp.torrent_import_staging"))
+    return inserted
+
+
+def import_torrents(stream, fmt, default_author_id, progress_callback=None, progress_every=10000):
+    # Всё в одной транзакции; commit делает вызывающий код (вместе с записью в Log)
+    progress = ImportProgress(progress_callback, progress_every)
+    rows = valid_rows(iter_records(stream, fmt), progress)
+    if db.session.get_bind().dialect.name == "postgresql":
+        _copy_to_staging_pg(rows)
+        inserted = _merge_pg(default_author_id)
+    else:
+        _copy_to_staging_sqlite(rows)
+        inserted = _merge_sqlite(default_author_id)
+    return progress.report(inserted)
@@ -0,0 +1,71 @@
+# HTTP conditional GET: ETag из resource_versions, 304 без запроса списка и рендера
+
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import update
+
+from models import db, ResourceVersion
+
+
+def touch(*resources):
+    # вызывается в транзакции записи; UPDATE ... SET version = version + 1 без чтения
+    now = datetime.utcnow()
+    for resource in resources:
+        result = db.session.execute(
+            update(ResourceVersion)
+            .where(ResourceVersion.resource == resource)
+            .values(version=ResourceVersion.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            db.session.add(ResourceVersion(resource=resource, version=1, updated_at=now))
+
+
+def resource_stamp(resource):
+    row = db.session.query(ResourceVersion.version, ResourceVersion.updated_at).filter(ResourceVersion.resource == resource).first()
+    if not row:
+        return 0, None
+    return row.version, row.updated_at.replace(microsecond=0)
+
+
+def make_etag(resource, version):
+    # страница зависит ещё от пользователя (роль, меню) и параметров запроса
+    variant = f'{resource}:{version}:{current_user.get_id()}:{current_user.user_role}:{request.full_path}'
+    return hashlib.sha1(variant.encode()).hexdigest()
+
+
+def conditional(resource):
+    # resource: строка или функция от аргументов вью, например lambda torrent_id: f"torrent:{torrent_id}"
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            name = resource(**kwargs) if callable(resource) else resource
+            version, updated_at = resource_stamp(name)
+            # вью использует ту же версию как ключ кэша фрагментов
+            g.resource_version = version
+            etag = make_etag(name, version)
+            # непоказанные flash-сообщения требуют полноценного рендера
+            if request.method == "GET" and "_flashes" not in session:
+                # 304 только по If-None-Match: If-Modified-Since не различает пользователя, роль и параметры
+                # запроса и точен до секунды, а Last-Modified отдаётся лишь для информации
+                if request.if_none_match and request.if_none_match.contains_weak(etag):
+                    response = make_response("", 304)
+                    return _set_validators(response, etag, updated_at)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                _set_validators(response, etag, updated_at)
+            return response
+        return wrapper
+    return decorator
+
+
+def _set_validators(response, etag, updated_at):
+    response.set_etag(etag, weak=True)
+    if updated_at:
+        response.last_modified = updated_at
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,131 @@
+# Выгрузка таблиц потоком: server-side cursor -> CSV / NDJSON / Parquet чанками
+# (замена old_ver/html_gen.py, который собирал DataFrame построчно через pd.concat)
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, select
+
+from models import db, User, Torrent, Log, Activity
+
+# пароли не выгружаются
+EXPORT_TABLES = {
+    "users": [c for c in User.__table__.columns if c.name != "user_password"],
+    "torrents": list(Torrent.__table__.columns),
+    "logs": list(Log.__table__.columns),
+    "activity": list(Activity.__table__.columns),
+}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def iter_batches(table, batch_size):
+    columns = EXPORT_TABLES[table]
+    primary_key = [c for c in columns if c.primary_key]
+    stmt = select(*columns).order_by(*primary_key).execution_options(yield_per=batch_size)
+    for partition in db.session.execute(stmt).partitions():
+        yield partition
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(table, batch_size):
+    columns = EXPORT_TABLES[table]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow([c.name for c in columns])
+    for batch in iter_batches(table, batch_size):
+        writer.writerows([[_value(v) for v in row] for row in batch])
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    if out.tell():
+        yield out.getvalue()
+
+
+def ndjson_chunks(table, batch_size):
+    names = [c.name for c in EXPORT_TABLES[table]]
+    for batch in iter_batches(table, batch_size):
+        yield "".join(json.dumps(dict(zip(names, (_value(v) for v in row)))) + "\n" for row in batch)
+
+
+class _ChunkSink:
+    # ParquetWriter пишет сюда, а мы отдаём накопленные байты после каждого record batch
+    def __init__(self):
+        self.buffer = io.BytesIO()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.buffer.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = self.buffer.getvalue()
+        self.buffer = io.BytesIO()
+        return data
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires the pyarrow package") from e
+
+
+def parquet_chunks(table, batch_size):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def arrow_type(column):
+        if isinstance(column.type, Integer):
+            return pa.int64()
+        if isinstance(column.type, DateTime):
+            return pa.timestamp("us")
+        return pa.string()
+
+    columns = EXPORT_TABLES[table]
+    schema = pa.schema([(c.name, arrow_type(c)) for c in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    for batch in iter_batches(table, batch_size):
+        # один record batch на пачку курсора: память ограничена batch_size строками
+        arrays = [pa.array([row[i] for row in batch], type=schema.field(i).type) for i in range(len(columns))]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def export_chunks(table, fmt, batch_size=1000):
+    if table not in EXPORT_TABLES:
+        raise ValueError(f'Unknown export table: {table}')
+    if fmt == "csv":
+        return csv_chunks(table, batch_size)
+    if fmt == "ndjson":
+        return ndjson_chunks(table, batch_size)
+    if fmt == "parquet":
+        # проверка до начала ответа, а не внутри генератора
+        _require_pyarrow()
+        return parquet_chunks(table, batch_size)
+    raise ValueError(f'Unknown export format: {fmt}')
@@ -0,0 +1,181 @@
+# Помесячное секционирование logs по action_time (PostgreSQL), хранение и архивация старых секций
+
+import gzip
+import os
+import re
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+PARTITION_NAME = re.compile(r"^logs_y(\d{4})m(\d{2})$")
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'logs_y{month.year:04d}m{month.month:02d}'
+
+
+def is_partitioned(conn):
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'logs')"
+    )).scalar()
+
+
+def list_partitions(conn):
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'logs'"
+    )).scalars()
+    partitions = {}
+    for name in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return dict(sorted(partitions.items()))
+
+
+def has_default_partition(conn):
+    return conn.execute(text("SELECT to_regclass('logs_default') IS NOT NULL")).scalar()
+
+
+def create_default_partition(conn):
+    # строки вне всех месячных секций (logs-maintain давно не запускался) попадают сюда,
+    # а не роняют каждый INSERT в logs
+    conn.execute(text("CREATE TABLE IF NOT EXISTS logs_default PARTITION OF logs DEFAULT"))
+
+
+def create_partition(conn, month):
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    bounds = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    in_default = has_default_partition(conn) and conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM logs_default WHERE action_time >= :start AND action_time < :end)"
+    ), {"start": start, "end": end}).scalar()
+    if not in_default:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF logs {bounds}"))
+        return
+    # PostgreSQL не создаст секцию, пока подходящие строки лежат в DEFAULT: переносим их
+    conn.execute(text(f"CREATE TABLE {name} (LIKE logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM logs_default WHERE action_time >= :start AND action_time < :end RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """), {"start": start, "end": end})
+    conn.execute(text(f"ALTER TABLE logs ATTACH PARTITION {name} {bounds}"))
+
+
+def ensure_partitions(conn, months_ahead=3, today=None):
+    current = month_start(today or datetime.utcnow())
+    created = []
+    if not has_default_partition(conn):
+        create_default_partition(conn)
+        created.append("logs_default")
+    # пропущенные месяцы, успевшие попасть в DEFAULT, получают свои секции
+    oldest = conn.execute(text("SELECT min(action_time) FROM logs_default")).scalar()
+    month = min(month_start(oldest), current) if oldest else current
+    last = add_months(current, months_ahead)
+    existing = list_partitions(conn)
+    while month <= last:
+        if month not in existing:
+            create_partition(conn, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(conn, months_ahead=3):
+    # Одноразовая миграция обычной таблицы logs (из db.create_all) в секционированную.
+    # Первичный ключ секционированной таблицы обязан включать ключ секционирования.
+    if is_partitioned(conn):
+        return False
+    conn.execute(text("ALTER TABLE logs RENAME TO logs_legacy"))
+    conn.execute(text("""
+        CREATE TABLE logs (
+            log_id integer NOT NULL DEFAULT nextval('logs_log_id_seq'),
+            author_id integer REFERENCES users (user_id),
+            target_id integer NOT NULL,
+            target_type varchar(10) NOT NULL,
+            action_type varchar(20) NOT NULL,
+            action_time timestamp NOT NULL
+        ) PARTITION BY RANGE (action_time)
+    """))
+    oldest = conn.execute(text("SELECT min(action_time) FROM logs_legacy")).scalar()
+    month = month_start(oldest or datetime.utcnow())
+    last = add_months(month_start(datetime.utcnow()), months_ahead)
+    while month <= last:
+        create_partition(conn, month)
+        month = add_months(month, 1)
+    create_default_partition(conn)
+    conn.execute(text("INSERT INTO logs SELECT log_id, author_id, target_id, target_type, action_type, action_time FROM logs_legacy"))
+    # последовательность принадлежит старой колонке и удалилась бы вместе с ней
+    conn.execute(text("ALTER SEQUENCE logs_log_id_seq OWNED BY logs.log_id"))
+    conn.execute(text("DROP TABLE logs_legacy"))
+    conn.execute(text("ALTER TABLE logs ADD PRIMARY KEY (log_id, action_time)"))
+    # индексы родителя создаются в каждой секции
+    conn.execute(text("CREATE INDEX ix_logs_action_time ON logs (action_time)"))
+    conn.execute(text("CREATE INDEX ix_logs_target_type_action_time ON logs (target_type, action_time)"))
+    conn.execute(text("CREATE INDEX ix_logs_action_type_action_time ON logs (action_type, action_time)"))
+    return True
+
+
+def _copy_out(conn, table, fileobj):
+    cursor = conn.connection.dbapi_connection.cursor()
+    sql = f"COPY {table} TO STDOUT WITH (FORMAT csv, HEADER)"
+    if hasattr(cursor, "copy_expert"):
+        # psycopg2
+        cursor.copy_expert(sql, fileobj)
+    else:
+        # psycopg 3
+        with cursor.copy(sql) as copy:
+            for data in copy:
+                fileobj.write(bytes(data))
+    cursor.close()
+
+
+def list_detached(conn):
+    # месячные таблицы, уже отсоединённые от logs, но ещё не удалённые (прерванный прошлый запуск)
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_class c WHERE c.relkind = 'r' AND c.relname LIKE 'logs\\_y%' "
+        "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+    )).scalars()
+    return sorted(name for name in rows if PARTITION_NAME.match(name))
+
+
+def _archive_and_drop(engine, name, archive_dir):
+    with engine.begin() as conn:
+        if archive_dir:
+            os.makedirs(archive_dir, exist_ok=True)
+            with gzip.open(os.path.join(archive_dir, f'{name}.csv.gz'), "wb") as f:
+                _copy_out(conn, name, f)
+        conn.execute(text(f"DROP TABLE {name}"))
+
+
+def apply_retention(engine, keep_months, archive_dir=None, today=None):
+    # секции старше keep_months отсоединяются, выгружаются в .csv.gz и удаляются.
+    # DETACH берёт ACCESS EXCLUSIVE на logs, поэтому фиксируется отдельной короткой транзакцией,
+    # а COPY и DROP идут уже по отсоединённой таблице и вставки в logs не блокируют.
+    # DETACH ... CONCURRENTLY недоступен: у logs есть секция DEFAULT
+    if not keep_months:
+        return []
+    cutoff = add_months(month_start(today or datetime.utcnow()), -keep_months)
+    with engine.connect() as conn:
+        pending = list_detached(conn)
+        old = [name for month, name in list_partitions(conn).items() if month < cutoff]
+    for name in old:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE logs DETACH PARTITION {name}"))
+        pending.append(name)
+    for name in pending:
+        _archive_and_drop(engine, name, archive_dir)
+    return pending
@@ -0,0 +1,197 @@
+# Инструментирование запросов: латентность, SQL, рендер шаблонов и размер ответа по endpoint,
+# экспорт в формате Prometheus. Счётчики на процесс: при нескольких воркерах каждый отдаёт свои
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+
+from querycount import listen_request_queries
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labels):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # [счётчики по бакетам..., +Inf], сумма
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for label_values, counts, total in sorted(items):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, value=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f'{self.name}{{{_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+
+def _labels(names, values):
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class RequestMetrics:
+    # состояние одного запроса; живёт в g и дописывается до закрытия потокового ответа.
+    # SQL считает querycount (g.query_count, g.query_time, g.query_log); держим ссылку на g,
+    # чтобы прочитать итог после генерации потокового тела
+    def __init__(self, request_globals):
+        self.started = time.perf_counter()
+        self.globals = request_globals
+        self.template_time = 0.0
+        self.template_started = []
+
+    @property
+    def sql_count(self):
+        return self.globals.get("query_count", 0)
+
+    @property
+    def sql_time(self):
+        return self.globals.get("query_time", 0.0)
+
+    @property
+    def statements(self):
+        return self.globals.get("query_log") or []
+
+
+class Metrics:
+    def __init__(self, slow_request_seconds=0):
+        self.slow_request_seconds = slow_request_seconds
+        self.requests = Counter("tracker_requests_total", "HTTP requests", ("endpoint", "method", "status"))
+        self.latency = Histogram("tracker_request_duration_seconds", "Request latency including streamed body", LATENCY_BUCKETS, ("endpoint", "method"))
+        self.sql_queries = Histogram("tracker_request_sql_queries", "SQL statements per request", QUERY_BUCKETS, ("endpoint",))
+        self.sql_seconds = Histogram("tracker_request_sql_seconds", "Total SQL time per request", LATENCY_BUCKETS, ("endpoint",))
+        self.template_seconds = Histogram("tracker_request_template_seconds", "Template render time per request", LATENCY_BUCKETS, ("endpoint",))
+        self.response_bytes = Histogram("tracker_response_size_bytes", "Response body size", SIZE_BUCKETS, ("endpoint",))
+
+    def finish(self, state, endpoint, method, status, size):
+        elapsed = time.perf_counter() - state.started
+        self.requests.inc((endpoint, method, status))
+        self.latency.observe((endpoint, method), elapsed)
+        self.sql_queries.observe((endpoint,), state.sql_count)
+        self.sql_seconds.observe((endpoint,), state.sql_time)
+        self.template_seconds.observe((endpoint,), state.template_time)
+        self.response_bytes.observe((endpoint,), size)
+        if self.slow_request_seconds and elapsed >= self.slow_request_seconds:
+            statements = "\n".join(f'  {duration * 1000:.1f} ms  {statement}' for statement, duration in state.statements)
+            logger.warning(
+                "Slow request %s %s: %.3f s, %d queries (%.3f s SQL)\n%s",
+                method, endpoint, elapsed, state.sql_count, state.sql_time, statements,
+            )
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.latency, self.sql_queries, self.sql_seconds, self.template_seconds, self.response_bytes):
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+def _state():
+    if has_request_context():
+        return g.get("metrics")
+    return None
+
+
+def _before_render(sender, template, context, **extra):
+    state = _state()
+    if state is not None:
+        state.template_started.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    state = _state()
+    if state is not None and state.template_started:
+        state.template_time += time.perf_counter() - state.template_started.pop()
+
+
+class _CountingIterable:
+    # считает байты потокового ответа, пока его читает WSGI-сервер
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            self.size += len(chunk)
+            yield chunk
+
+
+def init_metrics(app):
+    # METRICS_ENABLED=False — без хуков; SLOW_REQUEST_SECONDS > 0 — лог SQL медленных запросов
+    metrics = Metrics(app.config.get("SLOW_REQUEST_SECONDS", 0))
+    app.extensions["metrics"] = metrics
+    if not app.config.get("METRICS_ENABLED", True):
+        return metrics
+    listen_request_queries()
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics = RequestMetrics(g._get_current_object())
+        if metrics.slow_request_seconds:
+            g.query_log = []
+
+    @app.after_request
+    def record_request_metrics(response):
+        state = g.get("metrics")
+        if state is None:
+            return response
+        endpoint = request.url_rule.endpoint if request.url_rule else "unmatched"
+        method = request.method
+        status = response.status_code
+        if response.is_streamed:
+            # тело ещё не сгенерировано: фиксируем всё при закрытии ответа
+            counting = _CountingIterable(response.response)
+            response.response = counting
+            response.call_on_close(lambda: metrics.finish(state, endpoint, method, status, counting.size))
+        else:
+            metrics.finish(state, endpoint, method, status, response.content_length or 0)
+        return response
+
+    return metrics
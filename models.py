@@ -4,11 +4,17 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 
-db = SQLAlchemy()
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # User
 class User(db.Model, UserMixin):
     __tablename__ = "users"
+    __table_args__ = (
+        # /leaderboard: ORDER BY rating DESC, user_id DESC LIMIT n идёт по индексу
+        db.Index("ix_users_rating_user_id", "rating", "user_id"),
+    )
     user_id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(100), nullable=False)
     mail = db.Column(db.String(100), nullable=False)
@@ -21,32 +27,97 @@ class User(db.Model, UserMixin):
     
     def get_id(self):
         return str(self.user_id)
-    
+
+# register/login: поиск по username и lower(mail) идёт по уникальным индексам
+db.Index("uq_users_username", User.username, unique=True)
+db.Index("uq_users_mail_lower", db.func.lower(User.mail), unique=True)
+
+# Шардированные счётчики рейтинга для "горячих" пользователей, периодически сворачиваются в users.rating
+class UserRatingShard(db.Model):
+    __tablename__ = "user_rating_shards"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True)
+    delta = db.Column(db.Integer, nullable=False, default=0)
+
 # Torrent
 class Torrent(db.Model):
     __tablename__ = "torrents"
+    __table_args__ = (
+        # keyset pagination по автору: WHERE author_id = ? AND torrent_id < ? ORDER BY torrent_id DESC
+        db.Index("ix_torrents_author_id_torrent_id", "author_id", "torrent_id"),
+        db.Index("uq_torrents_hash_str", "hash_str", unique=True),
+        db.Index("uq_torrents_title", "title", unique=True),
+    )
     torrent_id = db.Column(db.Integer, primary_key=True)
     hash_str = db.Column(db.String(255), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.String(255), nullable=False)
     author_id = db.Column(db.Integer, db.ForeignKey("users.user_id"))
-    
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    author = db.relationship("User")
+    stats = db.relationship("TorrentStats", uselist=False)
+
+    def to_dict(self):
+        return {
+            "torrent_id": self.torrent_id,
+            "hash_str": self.hash_str,
+            "title": self.title,
+            "description": self.description,
+            "author_id": self.author_id,
+            "seeders": self.stats.seeders if self.stats else 0,
+            "leechers": self.stats.leechers if self.stats else 0,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+
+# Счётчики раздачи и комментариев (денормализация Activity/Comment)
+class TorrentStats(db.Model):
+    __tablename__ = "torrent_stats"
+    torrent_id = db.Column(db.Integer, db.ForeignKey("torrents.torrent_id"), primary_key=True)
+    seeders = db.Column(db.Integer, nullable=False, default=0)
+    leechers = db.Column(db.Integer, nullable=False, default=0)
+    comment_count = db.Column(db.Integer, nullable=False, default=0)
+
+# /torrents?sort=swarm: ORDER BY seeders + leechers DESC, torrent_id DESC
+db.Index("ix_torrent_stats_swarm", (TorrentStats.seeders + TorrentStats.leechers).desc(), TorrentStats.torrent_id.desc())
+
 
 # Activity
 class Activity(db.Model):
     __tablename__ = "activity"
+    __table_args__ = (
+        # одна строка на пару (user, torrent): цель для ON CONFLICT в change_torrent_status
+        db.Index("uq_activity_user_id_torrent_id", "user_id", "torrent_id", unique=True),
+    )
     activity_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"))
     torrent_id = db.Column(db.Integer, db.ForeignKey("torrents.torrent_id"))
     action_type = db.Column(db.String(100), nullable=False)
+    torrent = db.relationship("Torrent")
 
 # Comment
 class Comment(db.Model):
     __tablename__ = "tcomments"
+    __table_args__ = (
+        # страницы комментариев торрента: WHERE torrent_id = ? AND comment_id < ? ORDER BY comment_id DESC
+        db.Index("ix_tcomments_torrent_id_comment_id", "torrent_id", "comment_id"),
+    )
     comment_id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.user_id"))
-    torrent_id = db.Column(db.Integer, db.ForeignKey("torrent.torrent_id"))
+    user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"))
+    torrent_id = db.Column(db.Integer, db.ForeignKey("torrents.torrent_id"))
     comment_body = db.Column(db.String(500), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    author = db.relationship("User")
+
+    def to_dict(self):
+        return {
+            "comment_id": self.comment_id,
+            "torrent_id": self.torrent_id,
+            "user_id": self.user_id,
+            "author": self.author.username if self.author else None,
+            "comment_body": self.comment_body,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
 
 # ForumPost
 class ForumPost(db.Model):
@@ -55,13 +126,73 @@ class ForumPost(db.Model):
     author_id = db.Column(db.Integer, db.ForeignKey("users.user_id"))
     post_title = db.Column(db.String(200), nullable=False)
     post_body = db.Column(db.String(1000), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    author = db.relationship("User")
 
 # Moderation log
 class Log(db.Model):
     __tablename__ = "logs"
+    __table_args__ = (
+        # фильтры /logs: диапазон времени, target_type, action_type
+        db.Index("ix_logs_action_time", "action_time"),
+        db.Index("ix_logs_target_type_action_time", "target_type", "action_time"),
+        db.Index("ix_logs_action_type_action_time", "action_type", "action_time"),
+    )
     log_id = db.Column(db.Integer, primary_key=True)
     author_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=True)
     target_id = db.Column(db.Integer, nullable=False)
     target_type = db.Column(db.String(10), nullable=False)
     action_type = db.Column(db.String(20), nullable=False) # Seed, download, upload, etc.
     action_time = db.Column(db.DateTime, nullable=False,  default=datetime.utcnow)
+    author = db.relationship("User")
+
+# Версии ресурсов для ETag/Last-Modified: "torrents", "forum", "torrent:<id>"
+# (max(updated_at) не видит удалений, поэтому отдельный счётчик)
+class ResourceVersion(db.Model):
+    __tablename__ = "resource_versions"
+    resource = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Агрегаты logs для панели модератора (поддерживаются инкрементально, см. rollups.py)
+class LogRollup(db.Model):
+    __tablename__ = "log_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("granularity", "bucket_start", "action_type", "target_type", name="uq_log_rollups_bucket"),
+    )
+    rollup_id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    action_type = db.Column(db.String(20), nullable=False)
+    target_type = db.Column(db.String(10), nullable=False)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+
+class LogAuthorRollup(db.Model):
+    __tablename__ = "log_author_rollups"
+    __table_args__ = (
+        db.UniqueConstraint("granularity", "bucket_start", "author_id", "action_type", name="uq_log_author_rollups_bucket"),
+    )
+    rollup_id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(10), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey("users.user_id"), nullable=False)
+    action_type = db.Column(db.String(20), nullable=False)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+    author = db.relationship("User")
+
+class RollupWatermark(db.Model):
+    __tablename__ = "rollup_watermarks"
+    name = db.Column(db.String(50), primary_key=True)
+    last_log_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Серверные сессии (SESSION_BACKEND = "sql"), см. server_sessions.py
+class UserSession(db.Model):
+    __tablename__ = "user_sessions"
+    session_id = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.user_id", ondelete="CASCADE"), index=True)
+    data = db.Column(db.Text, nullable=False)
+    user_data = db.Column(db.Text)  # проекция CachedUser; NULL — перечитать при следующем запросе
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
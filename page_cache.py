@@ -0,0 +1,96 @@
+# Кэш отрендеренных фрагментов страниц: ключ = (namespace, id, версия, вариант)
+# Запись в БД увеличивает версию — старые фрагменты просто перестают находиться
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    def __init__(self, maxsize=1000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class RedisBackend:
+    # общий кэш для всех воркеров; нужен пакет redis
+    def __init__(self, url, ttl=300):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("PAGE_CACHE_REDIS_URL requires the redis package") from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(key)
+        return value.decode() if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(key, value, ex=self.ttl)
+
+
+class FragmentCache:
+    def __init__(self, backend, enabled=True):
+        self.backend = backend
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_render(self, namespace, key, version, variant, render):
+        # render() возвращает строку или None (None не кэшируется).
+        # version — версия из resource_versions, прочитанная в той же транзакции, что и данные:
+        # общая для всех воркеров, а фрагмент с отстающей реплики ляжет под старую версию
+        if not self.enabled:
+            return render()
+        cache_key = f'{namespace}:{key}:s{version}:{variant}'
+        value = self.backend.get(cache_key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = render()
+            if value is not None:
+                self.backend.set(cache_key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+def init_page_cache(app):
+    if app.config["PAGE_CACHE_REDIS_URL"]:
+        backend = RedisBackend(app.config["PAGE_CACHE_REDIS_URL"], ttl=app.config["PAGE_CACHE_TTL"])
+    else:
+        backend = MemoryBackend(maxsize=app.config["PAGE_CACHE_SIZE"], ttl=app.config["PAGE_CACHE_TTL"])
+    cache = FragmentCache(backend, enabled=app.config["PAGE_CACHE_ENABLED"])
+    app.extensions["page_cache"] = cache
+    return cache
@@ -0,0 +1,60 @@
+# Keyset (cursor) pagination для списков
+
+import base64
+import json
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(*values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    # битый или отсутствующий курсор — первая страница
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    return values
+
+
+def page_size(requested, default, maximum):
+    try:
+        size = int(requested)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def keyset_page(query, key_column, cursor, limit):
+    # WHERE key < :last ORDER BY key DESC LIMIT n+1 — без OFFSET, страница N стоит как первая
+    values = decode_cursor(cursor)
+    if values and isinstance(values[0], int):
+        query = query.filter(key_column < values[0])
+    rows = query.order_by(key_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], key_column.key))
+    return rows, next_cursor
+
+
+def keyset_page_multi(query, keys, cursor, limit):
+    # keys: [(выражение, значение из строки)], сортировка по всем DESC;
+    # (a, b) < (:a, :b) — row comparison, использует составной индекс
+    values = decode_cursor(cursor)
+    if values and len(values) == len(keys):
+        query = query.filter(tuple_(*[expr for expr, _ in keys]) < tuple_(*values))
+    rows = query.order_by(*[expr.desc() for expr, _ in keys]).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*[value(rows[-1]) for _, value in keys])
+    return rows, next_cursor
@@ -0,0 +1,141 @@
+# Хэширование паролей в ограниченном пуле процессов: CPU-тяжёлый хэш не блокирует потоки воркера
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    # очередь пула заполнена — запрос отклоняется сразу (503), а не ждёт
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, method="pbkdf2:sha256:600000", workers=2, max_pending=32, timeout=10.0):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        # префикс "метод:параметры" в том виде, в каком werkzeug пишет его в хэш
+        self.method_prefix = generate_password_hash("", method).split("$", 1)[0]
+        self.rejected = 0
+        self.completed = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # создаётся лениво и через spawn: fork из многопоточного процесса небезопасен
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise HasherBusy()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # слот освобождается, когда задача действительно закончилась в пуле, а не по таймауту ожидания:
+        # иначе зависшие хэши не ограничены max_pending
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except TimeoutError:
+            self._count("rejected")
+            raise HasherBusy()
+        self._count("completed")
+        return result
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split("$", 1)[0] != self.method_prefix
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        # _value у семафора — число свободных слотов
+        with self._lock:
+            completed, rejected = self.completed, self.rejected
+        return {
+            "workers": self.workers,
+            "method": self.method_prefix,
+            "in_flight": self.max_pending - self._slots._value,
+            "max_pending": self.max_pending,
+            "completed": completed,
+            "rejected": rejected,
+        }
+
+
+def init_passwords(app):
+    # PASSWORD_HASH_WORKERS = 0 — хэширование в потоке запроса (разработка, тесты)
+    hasher = PasswordHasher(
+        method=app.config.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000"),
+        workers=app.config.get("PASSWORD_HASH_WORKERS", 2),
+        max_pending=app.config.get("PASSWORD_HASH_MAX_PENDING", 32),
+        timeout=app.config.get("PASSWORD_HASH_TIMEOUT", 10.0),
+    )
+    atexit.register(hasher.close)
+    app.extensions["passwords"] = hasher
+    return hasher
+
+
+def benchmark(hasher, seconds=5.0, threads=8):
+    # threads потоков в цикле проверяют пароль: логинов в секунду всего и на ядро
+    stored = generate_password_hash("benchmark", hasher.method)
+    counts = {"ok": 0, "rejected": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < deadline:
+            try:
+                hasher.verify(stored, "benchmark")
+                key = "ok"
+            except HasherBusy:
+                key = "rejected"
+            with lock:
+                counts[key] += 1
+
+    started = time.monotonic()
+    pool = [threading.Thread(target=client) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.monotonic() - started
+    cores = hasher.workers or min(threads, os.cpu_count() or 1)
+    rate = counts["ok"] / elapsed
+    return {
+        "mode": "pool" if hasher.workers else "inline",
+        "threads": threads,
+        "cores": cores,
+        "logins": counts["ok"],
+        "rejected": counts["rejected"],
+        "logins_per_sec": round(rate, 1),
+        "logins_per_sec_per_core": round(rate / cores, 1),
+    }
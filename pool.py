@@ -0,0 +1,83 @@
+# Параметры движка SQLAlchemy и метрики пула соединений
+
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class MeteredQueuePool(QueuePool):
+    # QueuePool, который считает ожидание свободного соединения
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.wait_count += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+def engine_options(config, uri=None):
+    url = make_url(uri or config["SQLALCHEMY_DATABASE_URI"])
+    options = {"pool_pre_ping": config["DB_POOL_PRE_PING"]}
+    if url.get_backend_name() == "sqlite":
+        return options
+    connect_args = {}
+    if config["DB_POOL_DISABLED"]:
+        options["poolclass"] = NullPool
+    else:
+        options.update(
+            poolclass=MeteredQueuePool,
+            pool_size=config["DB_POOL_SIZE"],
+            max_overflow=config["DB_MAX_OVERFLOW"],
+            pool_timeout=config["DB_POOL_TIMEOUT"],
+            pool_recycle=config["DB_POOL_RECYCLE"],
+        )
+    if config["DB_PGBOUNCER"]:
+        # PgBouncer не пропускает startup options: statement_timeout задаётся на роли
+        # (ALTER ROLE ... SET statement_timeout); psycopg 3 не должен готовить запросы на сервере
+        if url.get_driver_name() == "psycopg":
+            connect_args["prepare_threshold"] = None
+    elif config["DB_STATEMENT_TIMEOUT_MS"]:
+        connect_args["options"] = f'-c statement_timeout={int(config["DB_STATEMENT_TIMEOUT_MS"])}'
+    if connect_args:
+        options["connect_args"] = connect_args
+    return options
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            in_use=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    if isinstance(pool, MeteredQueuePool):
+        with pool._stats_lock:
+            stats.update(
+                checkout_wait_count=pool.wait_count,
+                checkout_wait_total=pool.wait_total,
+                checkout_wait_max=pool.wait_max,
+                checkout_timeouts=pool.timeouts,
+            )
+    return stats
@@ -0,0 +1,75 @@
+# Подсчёт SQL-запросов: ловим N+1 регрессии
+
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine):
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    # with assert_max_queries(db.engine, 4): client.get("/torrents")
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        raise AssertionError(
+            f"{counter.count} queries executed, expected at most {limit}:\n" + "\n".join(counter.statements)
+        )
+
+
+def _count_request_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+        context._query_started = time.perf_counter()
+
+
+def _time_request_query(conn, cursor, statement, parameters, context, executemany):
+    # g.query_time — суммарное время SQL запроса; g.query_log (если заведён) — (statement, duration)
+    started = getattr(context, "_query_started", None)
+    if started is None or not has_request_context():
+        return
+    duration = time.perf_counter() - started
+    g.query_time = g.get("query_time", 0.0) + duration
+    log = g.get("query_log")
+    if log is not None:
+        log.append((statement, duration))
+
+
+def listen_request_queries():
+    # единственный счётчик SQL на запрос: X-Query-Count и метрики читают одни и те же g.query_*
+    if not event.contains(Engine, "before_cursor_execute", _count_request_query):
+        event.listen(Engine, "before_cursor_execute", _count_request_query)
+        event.listen(Engine, "after_cursor_execute", _time_request_query)
+
+
+def init_query_count(app):
+    # QUERY_COUNT_HEADER=True -> X-Query-Count in every response
+    listen_request_queries()
+
+    @app.after_request
+    def add_query_count_header(response):
+        if app.config.get("QUERY_COUNT_HEADER"):
+            response.headers["X-Query-Count"] = str(g.get("query_count", 0))
+        return response
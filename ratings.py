@@ -0,0 +1,62 @@
+# Рейтинг пользователей: атомарный инкремент, шардированные счётчики и таблица лидеров
+
+import random
+
+from sqlalchemy import func, select, text, update
+
+from models import db, User, UserRatingShard
+
+
+def increment_rating(user_id, shards=0):
+    # shards == 0: UPDATE users SET rating = rating + 1 RETURNING rating — без чтения строки
+    # и без потерянных голосов. shards > 0: голос уходит в одну из N строк user_rating_shards,
+    # блокировка строки users не берётся; рейтинг = users.rating + несвёрнутые дельты
+    if not shards:
+        return db.session.execute(
+            update(User).where(User.user_id == user_id).values(rating=User.rating + 1).returning(User.rating)
+        ).scalar()
+    db.session.execute(text("""
+        INSERT INTO user_rating_shards (user_id, shard, delta) VALUES (:user_id, :shard, 1)
+        ON CONFLICT (user_id, shard) DO UPDATE SET delta = user_rating_shards.delta + 1
+    """), {"user_id": user_id, "shard": random.randrange(shards)})
+    return current_rating(user_id)
+
+
+def current_rating(user_id):
+    pending = select(func.coalesce(func.sum(UserRatingShard.delta), 0)).where(UserRatingShard.user_id == user_id).scalar_subquery()
+    return db.session.execute(select(User.rating + pending).where(User.user_id == user_id)).scalar()
+
+
+def fold_rating_shards():
+    # Переносит дельты из шардов в users.rating одной транзакцией; возвращает число пользователей
+    if db.session.get_bind().dialect.name == "postgresql":
+        # DELETE ... RETURNING забирает ровно то, что переносится: голоса, пришедшие
+        # во время свёртки, попадут в новые строки шардов
+        folded = db.session.execute(text("""
+            WITH folded AS (
+                DELETE FROM user_rating_shards RETURNING user_id, delta
+            ), totals AS (
+                SELECT user_id, sum(delta) AS total FROM folded GROUP BY user_id
+            )
+            UPDATE users SET rating = users.rating + totals.total
+            FROM totals WHERE users.user_id = totals.user_id
+        """)).rowcount
+    else:
+        # SQLite: первый UPDATE берёт блокировку записи, до commit шарды никто не изменит
+        folded = db.session.execute(text("""
+            UPDATE users SET rating = rating + (
+                SELECT sum(delta) FROM user_rating_shards s WHERE s.user_id = users.user_id
+            ) WHERE user_id IN (SELECT user_id FROM user_rating_shards)
+        """)).rowcount
+        db.session.execute(text("DELETE FROM user_rating_shards"))
+    db.session.commit()
+    return folded
+
+
+def leaderboard(limit):
+    return (
+        db.session.query(User.user_id, User.username, User.rating)
+        .order_by(User.rating.desc(), User.user_id.desc())
+        .limit(limit)
+        .all()
+    )
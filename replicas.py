@@ -0,0 +1,120 @@
+# Маршрутизация чтения на реплики: round-robin или наименьшее отставание,
+# read-your-writes через короткое "липкое" окно в сессии пользователя
+
+import itertools
+import logging
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    def __init__(self, app, db, strategy="round_robin", max_lag=30, lag_check_interval=5):
+        self.app = app
+        self.db = db
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.keys = sorted(key for key in app.config.get("SQLALCHEMY_BINDS", {}) if key.startswith("replica_"))
+        self._cycle = itertools.cycle(self.keys)
+        self._lags = {}
+        self._lags_checked = 0.0
+        self._lock = threading.Lock()
+
+    def choose(self):
+        if not self.keys:
+            return None
+        if self.strategy == "least_lag":
+            lags = self.lags()
+            key, lag = min(lags.items(), key=lambda item: item[1])
+            if lag > self.max_lag:
+                return None
+        else:
+            with self._lock:
+                key = next(self._cycle)
+        return self.db.engines[key]
+
+    def lags(self):
+        with self._lock:
+            if time.monotonic() - self._lags_checked < self.lag_check_interval:
+                return dict(self._lags)
+            self._lags_checked = time.monotonic()
+        lags = {key: self._measure_lag(key) for key in self.keys}
+        with self._lock:
+            self._lags = lags
+        return dict(lags)
+
+    def _measure_lag(self, key):
+        engine = self.db.engines[key]
+        if engine.dialect.name != "postgresql":
+            return 0.0
+        try:
+            with engine.connect() as conn:
+                return float(conn.execute(text(
+                    "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                )).scalar())
+        except Exception:
+            logger.warning("Replica %s is unavailable", key, exc_info=True)
+            return float("inf")
+
+
+class RoutingSession(Session):
+    # Чтение в replica_read-вью идёт на выбранную для запроса реплику; flush и всё остальное — на primary
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            engine = g.get("db_replica")
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(db_session):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def replica_read(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # свои изменения пользователь читает с primary, пока не истечёт окно.
+        # Реплика выбирается один раз на запрос: штамп версии (ETag) и сами данные
+        # должны читаться с одного сервера
+        g.db_replica = None
+        if session.get("db_primary_until", 0) < time.time():
+            router = current_app.extensions.get("replicas")
+            g.db_replica = router.choose() if router else None
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def replica_binds(config, engine_options):
+    return {
+        f"replica_{i}": {"url": uri, **engine_options(config, uri)}
+        for i, uri in enumerate(config["DB_REPLICA_URIS"])
+    }
+
+
+def init_replicas(app, db):
+    router = ReplicaRouter(
+        app,
+        db,
+        strategy=app.config["DB_REPLICA_STRATEGY"],
+        max_lag=app.config["DB_REPLICA_MAX_LAG"],
+        lag_check_interval=app.config["DB_REPLICA_LAG_CHECK_INTERVAL"],
+    )
+    app.extensions["replicas"] = router
+
+    @app.after_request
+    def stick_to_primary(response):
+        if g.get("db_wrote"):
+            session["db_primary_until"] = time.time() + app.config["DB_READ_YOUR_WRITES_SECONDS"]
+        return response
+
+    return router
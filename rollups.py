@@ -0,0 +1,129 @@
+# Инкрементальные агрегаты logs: обрабатываются только log_id больше водяной отметки
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+
+from models import db, Log, LogRollup, LogAuthorRollup, RollupWatermark, User
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("hour", "day")
+
+
+def _bucket(dialect, granularity):
+    if dialect == "postgresql":
+        return f"date_trunc('{granularity}', action_time)"
+    fmt = "%Y-%m-%d %H:00:00" if granularity == "hour" else "%Y-%m-%d 00:00:00"
+    return f"strftime('{fmt}', action_time)"
+
+
+def update_rollups(settle_seconds=60):
+    # Строки из очереди аудита могут коммититься не по порядку log_id, поэтому берём
+    # только события старше settle_seconds — к этому времени "дыр" ниже отметки уже нет
+    dialect = db.session.get_bind().dialect.name
+    watermark = db.session.query(RollupWatermark).filter_by(name="logs").with_for_update().first()
+    if not watermark:
+        watermark = RollupWatermark(name="logs", last_log_id=0)
+        db.session.add(watermark)
+    low = watermark.last_log_id
+    settled = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    high = db.session.query(func.max(Log.log_id)).filter(Log.log_id > low, Log.action_time < settled).scalar()
+    if not high:
+        db.session.commit()
+        return 0
+    params = {"low": low, "high": high}
+    for granularity in GRANULARITIES:
+        bucket = _bucket(dialect, granularity)
+        params["granularity"] = granularity
+        db.session.execute(text(f"""
+            INSERT INTO log_rollups (granularity, bucket_start, action_type, target_type, event_count)
+            SELECT :granularity, {bucket}, action_type, target_type, count(*)
+            FROM logs WHERE log_id > :low AND log_id <= :high
+            GROUP BY {bucket}, action_type, target_type
+            ON CONFLICT (granularity, bucket_start, action_type, target_type)
+            DO UPDATE SET event_count = log_rollups.event_count + excluded.event_count
+        """), params)
+        db.session.execute(text(f"""
+            INSERT INTO log_author_rollups (granularity, bucket_start, author_id, action_type, event_count)
+            SELECT :granularity, {bucket}, author_id, action_type, count(*)
+            FROM logs WHERE log_id > :low AND log_id <= :high AND author_id IS NOT NULL
+            GROUP BY {bucket}, author_id, action_type
+            ON CONFLICT (granularity, bucket_start, author_id, action_type)
+            DO UPDATE SET event_count = log_author_rollups.event_count + excluded.event_count
+        """), params)
+    watermark.last_log_id = high
+    watermark.updated_at = datetime.utcnow()
+    db.session.commit()
+    return high - low
+
+
+class RollupWorker:
+    # фоновый поток внутри процесса; несколько воркеров сериализуются блокировкой строки watermark.
+    # В SQLite SELECT ... FOR UPDATE ничего не блокирует, и два процесса посчитали бы один диапазон дважды
+    def __init__(self, app, interval, settle_seconds):
+        with app.app_context():
+            dialect = db.engine.dialect.name
+        if dialect != "postgresql":
+            raise RuntimeError(f'ROLLUP_INTERVAL_SECONDS requires PostgreSQL, use "flask rollup-logs" on {dialect}')
+        self.app = app
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-rollups", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    update_rollups(self.settle_seconds)
+            except Exception:
+                logger.exception("Log rollup update failed")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def dashboard_data(days=7, hours=24, top=10):
+    now = datetime.utcnow()
+    day_from = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    hour_from = (now - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+    uploads_per_day = (
+        db.session.query(LogRollup.bucket_start, LogRollup.target_type, LogRollup.event_count)
+        .filter(LogRollup.granularity == "day", LogRollup.bucket_start >= day_from, LogRollup.action_type == "upload")
+        .order_by(LogRollup.bucket_start, LogRollup.target_type)
+        .all()
+    )
+    actions_last_hours = (
+        db.session.query(LogRollup.action_type, func.sum(LogRollup.event_count))
+        .filter(LogRollup.granularity == "hour", LogRollup.bucket_start >= hour_from)
+        .group_by(LogRollup.action_type)
+        .order_by(func.sum(LogRollup.event_count).desc())
+        .all()
+    )
+    top_raters = (
+        db.session.query(User.username, func.sum(LogAuthorRollup.event_count).label("ratings"))
+        .join(User, User.user_id == LogAuthorRollup.author_id)
+        .filter(
+            LogAuthorRollup.granularity == "day",
+            LogAuthorRollup.bucket_start >= day_from,
+            LogAuthorRollup.action_type == "add rating",
+        )
+        .group_by(User.username)
+        .order_by(func.sum(LogAuthorRollup.event_count).desc())
+        .limit(top)
+        .all()
+    )
+    watermark = db.session.get(RollupWatermark, "logs")
+    return {
+        "uploads_per_day": uploads_per_day,
+        "actions_last_hours": actions_last_hours,
+        "top_raters": top_raters,
+        "updated_at": watermark.updated_at if watermark else None,
+        "days": days,
+        "hours": hours,
+    }
@@ -0,0 +1,105 @@
+# Полнотекстовый поиск: PostgreSQL tsvector + GIN, SQLite FTS5 как запасной вариант
+
+from sqlalchemy import text
+
+# kind -> (таблица, первичный ключ, поля, колонка для ссылки)
+SEARCH_SOURCES = {
+    "torrent": ("torrents", "torrent_id", ("title", "description"), "torrent_id"),
+    "post": ("forumposts", "post_id", ("post_title", "post_body"), "post_id"),
+    "comment": ("tcomments", "comment_id", ("comment_body",), "torrent_id"),
+}
+
+
+def _pg_vector(columns, language):
+    # первое поле (заголовок) весит больше остальных
+    parts = []
+    for weight, column in zip("ABCD", columns):
+        parts.append(f"setweight(to_tsvector('{language}'::regconfig, coalesce({column}, '')), '{weight}')")
+    return " || ".join(parts)
+
+
+def _pg_schema(language):
+    statements = []
+    for table, _, columns, _ in SEARCH_SOURCES.values():
+        statements.append(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({_pg_vector(columns, language)}) STORED"
+        )
+        statements.append(f"CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} USING GIN (search_vector)")
+    return statements
+
+
+def _sqlite_schema():
+    statements = []
+    for table, pk, columns, _ in SEARCH_SOURCES.values():
+        fts = f"{table}_fts"
+        cols = ", ".join(columns)
+        new_cols = ", ".join(f"new.{c}" for c in columns)
+        old_cols = ", ".join(f"old.{c}" for c in columns)
+        statements += [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='{pk}')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.{pk}, {new_cols}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.{pk}, {old_cols}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.{pk}, {old_cols}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.{pk}, {new_cols}); END",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+    return statements
+
+
+def init_search_schema(engine, language="simple"):
+    if engine.dialect.name == "postgresql":
+        statements = _pg_schema(language)
+    elif engine.dialect.name == "sqlite":
+        statements = _sqlite_schema()
+    else:
+        raise RuntimeError(f'Full-text search is not supported on {engine.dialect.name}')
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+
+def _pg_select(kind, language):
+    table, pk, columns, link = SEARCH_SOURCES[kind]
+    return (
+        f"SELECT '{kind}' AS kind, {pk} AS id, {link} AS link_id, left({columns[0]}, 200) AS title, "
+        f"ts_rank(search_vector, q) AS rank "
+        f"FROM {table}, websearch_to_tsquery('{language}'::regconfig, :q) AS q WHERE search_vector @@ q"
+    )
+
+
+def _sqlite_select(kind):
+    table, pk, columns, link = SEARCH_SOURCES[kind]
+    fts = f"{table}_fts"
+    return (
+        f"SELECT '{kind}' AS kind, t.{pk} AS id, t.{link} AS link_id, substr(t.{columns[0]}, 1, 200) AS title, "
+        f"-bm25({fts}) AS rank "
+        f"FROM {fts} JOIN {table} t ON t.{pk} = {fts}.rowid WHERE {fts} MATCH :q"
+    )
+
+
+def _fts5_query(q):
+    # пользовательский ввод -> набор фраз в кавычках, чтобы FTS5 не разбирал операторы
+    words = q.split()
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def search(session, q, kinds=None, limit=20, offset=0, language="simple"):
+    # Ранжированный результат нельзя листать по первичному ключу, поэтому LIMIT/OFFSET
+    # с ограничением глубины на стороне вызывающего кода
+    kinds = [k for k in (kinds or SEARCH_SOURCES) if k in SEARCH_SOURCES]
+    if not q.strip() or not kinds:
+        return []
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        selects = [_pg_select(kind, language) for kind in kinds]
+        params = {"q": q}
+    else:
+        selects = [_sqlite_select(kind) for kind in kinds]
+        params = {"q": _fts5_query(q)}
+    sql = " UNION ALL ".join(selects) + " ORDER BY rank DESC, id DESC LIMIT :limit OFFSET :offset"
+    params.update(limit=limit, offset=offset)
+    return [dict(row._mapping) for row in session.execute(text(sql), params)]
@@ -0,0 +1,262 @@
+# Серверные сессии вместо подписанной cookie: в cookie только случайный id,
+# данные и проекция пользователя — в хранилище (память или таблица user_sessions)
+
+import atexit
+import json
+import logging
+import secrets
+import threading
+from datetime import datetime
+
+from flask import request
+from flask.sessions import SessionInterface, SessionMixin
+from sqlalchemy import delete, select, update
+from werkzeug.datastructures import CallbackDict
+
+from models import db, UserSession
+
+logger = logging.getLogger(__name__)
+
+
+# ключи Flask-Login в сессии
+AUTH_KEYS = ("_user_id", "_fresh", "_id", "_remember", "_remember_seconds")
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, user=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.user = user
+        self.expires_at = expires_at
+        self.loaded_user_id = (initial or {}).get("_user_id")
+        self.modified = False
+        self.user_modified = False
+
+    def set_user(self, projection):
+        self.user = projection
+        self.user_modified = True
+
+
+class MemorySessionStore:
+    # для тестов и одного процесса
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid, now):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None or entry["expires_at"] <= now:
+                return None
+            return json.loads(entry["data"]), entry["user"], entry["expires_at"]
+
+    def create(self, sid, user_id, data, user, expires_at):
+        with self._lock:
+            self._sessions[sid] = {"user_id": user_id, "data": json.dumps(data), "user": user, "expires_at": expires_at}
+
+    def update(self, sid, data, expires_at, user=None, write_user=False):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return False
+            entry["data"] = json.dumps(data)
+            entry["expires_at"] = expires_at
+            if write_user:
+                entry["user"] = user
+            return True
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            sids = [sid for sid, entry in self._sessions.items() if entry["user_id"] == user_id]
+            for sid in sids:
+                del self._sessions[sid]
+        return len(sids)
+
+    def forget_user(self, user_id):
+        with self._lock:
+            for entry in self._sessions.values():
+                if entry["user_id"] == user_id:
+                    entry["user"] = None
+
+    def sweep(self, now, batch_size=1000):
+        with self._lock:
+            expired = [sid for sid, entry in self._sessions.items() if entry["expires_at"] <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+    def stats(self):
+        return {"backend": "memory", "sessions": len(self._sessions)}
+
+
+class SqlSessionStore:
+    # Отдельное соединение с основной БД: сохранение сессии после ответа не должно
+    # коммитить сессию SQLAlchemy запроса и не должно уходить на реплику
+    def __init__(self, engine_getter):
+        self._engine = engine_getter
+        self.table = UserSession.__table__
+
+    def load(self, sid, now):
+        t = self.table
+        with self._engine().connect() as conn:
+            row = conn.execute(
+                select(t.c.data, t.c.user_data, t.c.expires_at).where(t.c.session_id == sid, t.c.expires_at > now)
+            ).first()
+        if row is None:
+            return None
+        return json.loads(row.data), json.loads(row.user_data) if row.user_data else None, row.expires_at
+
+    def create(self, sid, user_id, data, user, expires_at):
+        with self._engine().begin() as conn:
+            conn.execute(self.table.insert().values(
+                session_id=sid,
+                user_id=user_id,
+                data=json.dumps(data),
+                user_data=json.dumps(user) if user else None,
+                expires_at=expires_at,
+            ))
+
+    def update(self, sid, data, expires_at, user=None, write_user=False):
+        # только UPDATE: удалённую (отозванную) строку нельзя воскресить сохранением запроса
+        values = {"data": json.dumps(data), "expires_at": expires_at}
+        if write_user:
+            values["user_data"] = json.dumps(user) if user else None
+        with self._engine().begin() as conn:
+            return conn.execute(update(self.table).where(self.table.c.session_id == sid).values(**values)).rowcount > 0
+
+    def delete(self, sid):
+        with self._engine().begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.session_id == sid))
+
+    def revoke_user(self, user_id):
+        with self._engine().begin() as conn:
+            return conn.execute(delete(self.table).where(self.table.c.user_id == user_id)).rowcount
+
+    def forget_user(self, user_id):
+        with self._engine().begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.user_id == user_id).values(user_data=None))
+
+    def sweep(self, now, batch_size=1000):
+        # пачками по индексу expires_at: короткие транзакции, без долгой блокировки таблицы
+        t = self.table
+        total = 0
+        while True:
+            batch = select(t.c.session_id).where(t.c.expires_at <= now).limit(batch_size)
+            with self._engine().begin() as conn:
+                deleted = conn.execute(delete(t).where(t.c.session_id.in_(batch.scalar_subquery()))).rowcount
+            total += deleted
+            if deleted < batch_size:
+                return total
+
+    def stats(self):
+        return {"backend": "sql"}
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store, refresh_ratio=0.5):
+        self.store = store
+        # срок продлевается, когда осталось меньше refresh_ratio от lifetime — не запись на каждый запрос
+        self.refresh_ratio = refresh_ratio
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            found = self.store.load(sid, datetime.utcnow())
+            if found:
+                data, user, expires_at = found
+                return ServerSession(data, sid=sid, user=user, expires_at=expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        user_id = session.get("_user_id")
+        if session.sid and user_id != session.loaded_user_id:
+            # вход/выход: новый id, чтобы старая cookie не давала доступа (session fixation)
+            self.store.delete(session.sid)
+            session.sid = None
+        if not session:
+            if session.sid or name in request.cookies:
+                if session.sid:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        now = datetime.utcnow()
+        lifetime = app.permanent_session_lifetime
+        stale = session.expires_at is None or session.expires_at - now < lifetime * self.refresh_ratio
+        if session.sid and not (session.modified or session.user_modified or stale):
+            return
+        expires_at = now + lifetime
+        if session.sid and not self.store.update(session.sid, dict(session), expires_at, session.user, session.user_modified):
+            # сессию отозвали или удалили, пока шёл запрос: вход не восстанавливается,
+            # остальные данные (flash) уходят в новую сессию без пользователя
+            for key in AUTH_KEYS:
+                session.pop(key, None)
+            session.sid = None
+            session.user = None
+            user_id = None
+            if not session:
+                response.delete_cookie(name, domain=domain, path=path)
+                return
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            self.store.create(session.sid, int(user_id) if user_id else None, dict(session), session.user, expires_at)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+class SessionSweeper:
+    def __init__(self, app, store, interval, batch_size):
+        self.app = app
+        self.store = store
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                with self.app.app_context():
+                    self.store.sweep(datetime.utcnow(), self.batch_size)
+            except Exception:
+                logger.exception("Session sweep failed")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def init_sessions(app, db):
+    # SESSION_BACKEND: "cookie" (стандартная подписанная cookie Flask), "memory" или "sql"
+    backend = app.config.get("SESSION_BACKEND", "cookie")
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        store = MemorySessionStore()
+    elif backend == "sql":
+        store = SqlSessionStore(lambda: db.engine)
+    else:
+        raise RuntimeError(f'Unknown SESSION_BACKEND: {backend}')
+    app.session_interface = ServerSideSessionInterface(store)
+    if app.config.get("SESSION_SWEEP_INTERVAL"):
+        sweeper = SessionSweeper(app, store, app.config["SESSION_SWEEP_INTERVAL"], app.config.get("SESSION_SWEEP_BATCH", 1000))
+        atexit.register(sweeper.close)
+    return store
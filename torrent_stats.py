@@ -0,0 +1,51 @@
+# Поддержка torrent_stats: инкременты в транзакции запроса и полная пересборка
+
+from sqlalchemy import func, select, update
+
+from models import db, Activity, Comment, Torrent, TorrentStats
+
+
+def bump_stats(torrent_id, seeders=0, leechers=0, comments=0):
+    # UPDATE ... SET x = x + :d — без чтения строки и без потерянных обновлений
+    result = db.session.execute(
+        update(TorrentStats)
+        .where(TorrentStats.torrent_id == torrent_id)
+        .values(
+            seeders=TorrentStats.seeders + seeders,
+            leechers=TorrentStats.leechers + leechers,
+            comment_count=TorrentStats.comment_count + comments,
+        )
+    )
+    if result.rowcount == 0:
+        # торрент старше таблицы статистики: заводим строку
+        db.session.add(TorrentStats(torrent_id=torrent_id, seeders=max(seeders, 0), leechers=max(leechers, 0), comment_count=max(comments, 0)))
+
+
+def activity_delta(action_type, sign=1):
+    if action_type == "seed":
+        return {"seeders": sign}
+    return {"leechers": sign}
+
+
+def rebuild_torrent_stats():
+    # офлайн-пересборка для исправления расхождений, одним набором запросов
+    seeders = (
+        select(func.count())
+        .where(Activity.torrent_id == Torrent.torrent_id, Activity.action_type == "seed")
+        .scalar_subquery()
+    )
+    leechers = (
+        select(func.count())
+        .where(Activity.torrent_id == Torrent.torrent_id, Activity.action_type == "peer")
+        .scalar_subquery()
+    )
+    comments = select(func.count()).where(Comment.torrent_id == Torrent.torrent_id).scalar_subquery()
+    db.session.execute(TorrentStats.__table__.delete())
+    db.session.execute(
+        TorrentStats.__table__.insert().from_select(
+            ["torrent_id", "seeders", "leechers", "comment_count"],
+            select(Torrent.torrent_id, seeders, leechers, comments),
+        )
+    )
+    db.session.commit()
+    return db.session.query(func.count(TorrentStats.torrent_id)).scalar()